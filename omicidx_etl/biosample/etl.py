@@ -5,8 +5,10 @@ import orjson
 from upath import UPath
 import urllib.request
 from google.cloud import bigquery
+from ..etl import db
 from prefect import task, flow
 from ..config import settings
+from ..compression import open_gzip
 
 from ..logging import get_logger
 from .schema import get_schema
@@ -29,7 +31,7 @@ def load_bioentities_to_bigquery(entity: str, plural_entity: str):
         plural_entity (str): The plural form of the entity.
     """
 
-    client = bigquery.Client()
+    client = db.get_bigquery_client()
     load_job_config = bigquery.LoadJobConfig(
         source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
         schema=get_schema(entity),
@@ -61,7 +63,7 @@ def biosample_parse(url: str):
         max_lines_per_file = 100000
 
         outfile_path = UPath(OUTPUT_DIR) / f"biosample-{file_counter:06}.ndjson.gz"
-        outfile = UPath(outfile_path).open("wb", compression="gzip")
+        outfile = open_gzip(outfile_path)
 
         with gzip.open(tmpfile.name, "rb") as fh:
             for obj in BioSampleParser(fh, validate_with_schema=False):  # type: ignore
@@ -71,10 +73,10 @@ def biosample_parse(url: str):
                     outfile_path = (
                         UPath(OUTPUT_DIR) / f"biosample-{file_counter:06}.ndjson.gz"
                     )
-                    outfile = UPath(outfile_path).open("wb", compression="gzip")
+                    outfile = open_gzip(outfile_path)
                     obj_counter = 0
 
-                outfile.write(orjson.dumps(obj) + b"\n")
+                outfile.write(orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE))
                 obj_counter += 1
 
         outfile.close()
@@ -95,7 +97,7 @@ def bioproject_parse(url: str):
         max_lines_per_file = 100000
 
         outfile_path = UPath(OUTPUT_DIR) / f"bioproject-{file_counter:06}.ndjson.gz"
-        outfile = UPath(outfile_path).open("wb", compression="gzip")
+        outfile = open_gzip(outfile_path)
 
         with open(tmpfile.name, "rb") as fh:
             for obj in BioProjectParser(fh, validate_with_schema=False):  # type: ignore
@@ -105,10 +107,10 @@ def bioproject_parse(url: str):
                     outfile_path = (
                         UPath(OUTPUT_DIR) / f"bioproject-{file_counter:06}.ndjson.gz"
                     )
-                    outfile = UPath(outfile_path).open("wb", compression="gzip")
+                    outfile = open_gzip(outfile_path)
                     obj_counter = 0
 
-                outfile.write(orjson.dumps(obj) + b"\n")
+                outfile.write(orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE))
                 obj_counter += 1
 
         outfile.close()
@@ -1,4 +1,5 @@
 from google.cloud import bigquery
+from ..schemas import read_only
 
 schema = {}
 
@@ -84,5 +85,8 @@ schema["bioproject"] = [
 ]
 
 
+schema = read_only(schema)
+
+
 def get_schema(entity: str):
     return schema[entity]
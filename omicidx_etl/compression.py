@@ -0,0 +1,59 @@
+"""gzip helpers for writing ndjson outputs"""
+
+import io
+from upath import UPath
+
+try:
+    # isal is a drop-in replacement for gzip that is several times faster
+    from isal import igzip as gzip
+except ImportError:
+    import gzip
+
+# the ndjson outputs are very redundant (repeated keys), so a low
+# compression level compresses nearly as well as the default of 9
+DEFAULT_COMPRESSLEVEL = 3
+# records are small, so coalesce them before handing them to the compressor
+WRITE_BUFFER_SIZE = 1 << 20
+
+
+class GzipWriter:
+    """Write-only gzip stream to a local or remote path.
+
+    Unlike `gzip.GzipFile(fileobj=...)`, closing the writer also closes
+    the underlying file, which for remote paths finalizes the upload.
+    Writes are buffered so that the compressor sees large chunks rather
+    than one call per record.
+
+    Args:
+        path (UPath): The path to write to.
+        compresslevel (int): The gzip compression level.
+    """
+
+    def __init__(self, path: UPath, compresslevel: int = DEFAULT_COMPRESSLEVEL):
+        self._raw = UPath(path).open("wb")
+        self._gz = gzip.open(self._raw, "wb", compresslevel=compresslevel)
+        self._buffer = io.BufferedWriter(self._gz, buffer_size=WRITE_BUFFER_SIZE)
+
+    def write(self, data: bytes) -> int:
+        return self._buffer.write(data)
+
+    def writelines(self, lines) -> None:
+        self._buffer.writelines(lines)
+
+    def close(self) -> None:
+        try:
+            # closing the buffer flushes it and closes the gzip stream
+            self._buffer.close()
+        finally:
+            self._raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_gzip(path: UPath, compresslevel: int = DEFAULT_COMPRESSLEVEL) -> GzipWriter:
+    """Open a path for writing gzip-compressed bytes."""
+    return GzipWriter(path, compresslevel=compresslevel)
@@ -10,6 +10,14 @@ class Settings(BaseSettings):
 
     PUBLISH_DIRECTORY: str
 
+    # number of concurrent GEO SOFT fetch workers
+    GEO_FETCHERS: int = 30
+    # capacity of the in-memory streams between the GEO pipeline stages
+    GEO_STREAM_BUF: int = 1000
+    # concurrent entrez esearch requests; eutils allows 3 per second
+    # without an API key
+    GEO_ESEARCH_CONCURRENCY: int = 3
+
 
 settings = Settings()  # type: ignore
 
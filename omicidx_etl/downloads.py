@@ -0,0 +1,35 @@
+"""helpers shared by the flows that download and convert NCBI files"""
+
+import functools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+# parsing and compressing are CPU bound, but every worker also streams
+# its file from NCBI, which throttles concurrent downloads
+MAX_WORKERS = min(os.cpu_count() or 1, 4)
+
+
+@functools.lru_cache(maxsize=1)
+def get_http_client() -> httpx.Client:
+    """Return the HTTP client shared by all downloads in this process.
+
+    Reusing one client keeps the connection to NCBI alive across files
+    instead of paying a TCP and TLS handshake for every file. The client
+    is created lazily so that each worker process gets its own.
+    """
+    return httpx.Client(http2=True, timeout=60, follow_redirects=True)
+
+
+def process_pool(max_workers: int = MAX_WORKERS) -> ProcessPoolExecutor:
+    """Return a process pool for converting files in parallel.
+
+    The workers are spawned rather than forked: the flow process runs
+    Prefect's (and httpx's) background threads, and forking a threaded
+    process can deadlock the children.
+    """
+    return ProcessPoolExecutor(
+        max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+    )
@@ -1,4 +1,6 @@
+from functools import lru_cache
 import clickhouse_connect as ch
+from google.cloud import bigquery
 from .config import settings
 
 
@@ -9,3 +11,13 @@ def get_client():
         password=settings.CLICKHOUSE_PASSWORD,
         database=settings.CLICKHOUSE_DATABASE,
     )
+
+
+@lru_cache(maxsize=1)
+def get_bigquery_client() -> bigquery.Client:
+    """Return a BigQuery client shared by all loads in the process.
+
+    Client construction does credential discovery and sets up an HTTP
+    session, so it is only done once. The client is thread-safe.
+    """
+    return bigquery.Client()
@@ -6,17 +6,20 @@ import pathlib
 import fsspec
 import shutil
 import httpx
+import orjson
 from upath import UPath
 from google.cloud import bigquery
 from prefect import task, flow
 
 from ..logging import get_logger
-
-logger = get_logger(__name__)
+from ..compression import open_gzip
 
 PROJECT_ID = "gap-som-dbmi-sd-app-fq9"
 DATASET_ID = "omicidx"
 ICITE_COLLECTION_ID = 4586573
+ICITE_SOURCE_FILES = ["icite_metadata.tar.gz", "open_citation_collection.zip"]
+# records the checksums of the figshare files behind the current outputs
+SOURCE_MARKER = UPath("gs://omicidx/icite/_source_files.json")
 
 
 def get_run_logger():
@@ -49,24 +52,30 @@ def get_icite_article_files(article_id: str):
 
 
 @task
-def expand_tarfile(tarfname: str, dest: str) -> list[str]:
-    pathlib.Path(dest).mkdir(parents=True, exist_ok=True)
+def stream_icite_tarfile(file_json: list[dict]) -> list[str]:
+    """Upload the json files in the icite tarball to GCS.
 
-    with tarfile.open(tarfname) as tar:
-        logger.info(f"Extracting {tarfname}")
-        for fname in tar.getnames():
+    The tarball is read from figshare as a stream (tarfile mode "r|gz")
+    and each member is recompressed straight to GCS, so neither the
+    tarball nor the extracted files touch local disk.
+    """
+    url = list(filter(lambda x: x["name"] == "icite_metadata.tar.gz", file_json))[0][
+        "download_url"
+    ]  # type: ignore
+    up = UPath("gs://omicidx/icite")
+    uploaded = []
+    with urlopen(url) as f, tarfile.open(fileobj=f, mode="r|gz") as tar:
+        logger.info(f"Streaming {url}")
+        for member in tar:
+            fname = member.name
             if fname.endswith(".json"):
-                logger.info(f"Extracting {fname}")
-                tar.extract(fname, dest)
                 logger.info(f"Uploading {fname} to GCS")
-                up = UPath("gs://omicidx/icite")
-                localfile = pathlib.Path(f"{dest}/{fname}")
-                upfile = up / str(localfile.with_suffix(".jsonl.gz").name)
-                with open(localfile, "rb") as lf:
-                    with upfile.open("wb", compression="gzip") as uf:
+                upfile = up / str(pathlib.Path(fname).with_suffix(".jsonl.gz").name)
+                with tar.extractfile(member) as lf:  # type: ignore
+                    with open_gzip(upfile) as uf:
                         shutil.copyfileobj(lf, uf)
-                localfile.unlink(missing_ok=True)
-                pathlib.Path(tarfname).unlink(missing_ok=True)
+                uploaded.append(str(upfile))
+    return uploaded
 
 
 @task
@@ -81,29 +90,36 @@ def expand_zipfile(zipfname: str) -> str:
     return "open_citation_collection.csv"
 
 
-@task
-def download_icite_file(file_json: list[dict]) -> str:
-    url = list(filter(lambda x: x["name"] == "icite_metadata.tar.gz", file_json))[0][
-        "download_url"
-    ]  # type: ignore
-    with urlopen(url) as f:
-        logger.info(f"Downloading {url}")
-        shutil.copyfileobj(f, open("icite_metadata.tar.gz", "wb"))
-    return "icite_metadata.tar.gz"
-
-
 @task
 def download_opencitation_file(file_json: list[dict]) -> str:
     url = list(
         filter(lambda x: x["name"] == "open_citation_collection.zip", file_json)
     )[0]["download_url"]
-    print(url)
     with urlopen(url) as f:
         logger.info(f"Downloading {url}")
         shutil.copyfileobj(f, open("open_citation_collection.zip", "wb"))
     return "open_citation_collection.zip"
 
 
+def source_checksums(file_json: list[dict]) -> dict[str, str]:
+    return {
+        f["name"]: f["computed_md5"]
+        for f in file_json
+        if f["name"] in ICITE_SOURCE_FILES
+    }
+
+
+def source_files_unchanged(file_json: list[dict]) -> bool:
+    """Whether the figshare files match those of the last successful run."""
+    if not SOURCE_MARKER.exists():
+        return False
+    return orjson.loads(SOURCE_MARKER.read_bytes()) == source_checksums(file_json)
+
+
+def record_source_files(file_json: list[dict]) -> None:
+    SOURCE_MARKER.write_bytes(orjson.dumps(source_checksums(file_json)))
+
+
 def get_gcs_fs():
     return fsspec.filesystem("gs")
 
@@ -145,7 +161,7 @@ def load_to_clickhouse():
 
 @task
 def load_to_bigquery():
-    client = bigquery.Client()
+    client = db.get_bigquery_client()
     job_config = bigquery.LoadJobConfig(
         autodetect=True,
         source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
@@ -163,27 +179,35 @@ def icite_flow() -> tuple[list[str], str]:
     """Flow to ingest icite data from figshare
 
     The NIH ICITE data is stored in a figshare collection. This flow
-    downloads the data from figshare, extracts the tarfile, and uploads
-    the json files to GCS.
+    streams the tarfile from figshare and uploads the json files it
+    contains to GCS.
 
     Since there are updates to the data, the flow also cleans out the
     GCS directory before uploading the new data.
 
     The article is "updated" monthly, so the flow must first find
-    the latest version of the data using the figshare API.
+    the latest version of the data using the figshare API. If the
+    checksums of the figshare files match those recorded by the last
+    successful run, nothing is downloaded.
 
     """
     articles: list[dict] = get_icite_collection_articles()  # type: ignore
     files: list[dict] = get_icite_article_files(articles[0]["id"])  # type: ignore
-    icite_tarfile = download_icite_file(files)
-    icite_tarfile = "icite_metadata.tar.gz"
-    opencitation_zipfile = download_opencitation_file(files)
+    if source_files_unchanged(files):
+        logger.info("ICITE files are unchanged since the last run. Skipping")
+        return [], ""
+    # the icite and open citation files are independent, so process
+    # them concurrently; GCS is cleaned out before any uploads start
+    opencitation_zipfile = download_opencitation_file.submit(files)
     clean_out_gcs_dir("omicidx-json/icite")
     clean_out_gcs_dir("omicidx-json/opencitation")
-    opencitation_file = expand_zipfile(opencitation_zipfile)  # type: ignore
-    icite_files = expand_tarfile(icite_tarfile, "icite")  # type: ignore
+    icite_files = stream_icite_tarfile.submit(files)
+    opencitation_file = expand_zipfile.submit(opencitation_zipfile)  # type: ignore
     # load_to_clickhouse()
-    return icite_files, opencitation_file
+    result = icite_files.result(), opencitation_file.result()
+    # only record the sources once everything has been uploaded
+    record_source_files(files)
+    return result
 
 
 if __name__ == "__main__":
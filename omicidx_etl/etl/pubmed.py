@@ -3,17 +3,23 @@ import re
 import datetime
 import pubmed_parser as pp
 import orjson
-from urllib.request import urlretrieve
 import tempfile
+from concurrent.futures import as_completed
 from prefect import task, flow
 from .pubmed_load import load_to_bigquery
 
 
 from ..logging import get_logger
+from ..compression import open_gzip
+from ..downloads import MAX_WORKERS, get_http_client, process_pool
 
 JOB_NAME = "projects/omicidx-338300/locations/us-central1/jobs/pubmed-builder"
 PUBMED_BASE = UPath("https://ftp.ncbi.nlm.nih.gov/pubmed")
 OUTPUT_UPATH = UPath("gs://omicidx/pubmed")
+# pubmed files are tens of MB; read them in large chunks
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# extra attempts for each pubmed file before the flow fails
+FILE_RETRIES = 1
 
 logger = get_logger(__name__)
 
@@ -58,14 +64,15 @@ class PubmedManager:
         self.existing_urls = id_to_existing_url_map
 
     def needed_ids(self, replace=False):
-        """Return the ids that are needed to be processed."""
-        in_ids = set(self.available_urls.keys())
-        out_ids = set(self.existing_urls.keys())
+        """Return the ids that are needed to be processed.
 
+        Uses the listings cached by `load_available` and `load_existing`
+        rather than re-listing the remote directories.
+        """
         if replace:
-            return in_ids
+            return set(self.available_urls)
 
-        return in_ids - out_ids
+        return self.available_urls.keys() - self.existing_urls.keys()
 
     def needed_urls(self, replace=False) -> list[UPath]:
         """Return the urls that are needed to be processed."""
@@ -76,30 +83,62 @@ class PubmedManager:
         return self.output_url / fname_out
 
     def pubmed_url_to_json_file(self, url: UPath) -> None:
-        """Pubmed files as json asset
-
-        This asset covers the entire pubmed corpus. It is partitioned by
-        pubmed file. Each partition is a line iterator that yields json
-        objects for each article in the pubmed file after conversion from
-        xml to json. The json objects are serialized to bytes using orjson.
-        """
-        with tempfile.NamedTemporaryFile(suffix=".xml.gz") as f:
-            localfname = f.name
-            urlretrieve(str(url), filename=localfname)
-            generator = pp.parse_medline_xml(
-                localfname,
-                year_info_only=False,
-                nlm_category=True,
-                author_list=True,
-                reference_list=True,
-                parse_downto_mesh_subterms=True,
-            )
-            with self.json_file_for_url(url).open("wb", compression="gzip") as outfile:
-                logger.info(f"Writing {url} to {str(outfile)}")
-                for obj in generator:
-                    obj["_inserted_at"] = datetime.datetime.now()
-                    obj["_read_from"] = str(url)
-                    outfile.write(orjson.dumps(obj) + b"\n")
+        """Convert one pubmed file to gzipped json in the output directory."""
+        pubmed_url_to_json_file(url, self.json_file_for_url(url))
+
+
+def convert_pubmed_file(url: UPath, json_file: UPath) -> None:
+    """Pubmed files as json asset
+
+    This asset covers the entire pubmed corpus. It is partitioned by
+    pubmed file. Each partition is a line iterator that yields json
+    objects for each article in the pubmed file after conversion from
+    xml to json. The json objects are serialized to bytes using orjson.
+
+    The source url is not repeated on every record; the output file
+    name already identifies the pubmed file it was read from.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".xml.gz") as f:
+        localfname = f.name
+        with get_http_client().stream("GET", str(url)) as response:
+            response.raise_for_status()
+            # the files are already gzipped, so skip httpx's decoding
+            for chunk in response.iter_raw(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+        f.flush()
+        generator = pp.parse_medline_xml(
+            localfname,
+            year_info_only=False,
+            nlm_category=True,
+            author_list=True,
+            reference_list=True,
+            parse_downto_mesh_subterms=True,
+        )
+        # open_gzip buffers the per-record writes into 1 MiB chunks
+        with open_gzip(json_file) as outfile:
+            logger.info(f"Writing {url} to {json_file}")
+            for obj in generator:
+                obj["_inserted_at"] = datetime.datetime.now()
+                outfile.write(orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE))
+
+
+def pubmed_url_to_json_file(
+    url: UPath, json_file: UPath, retries: int = FILE_RETRIES
+) -> None:
+    """Convert one pubmed file, retrying failed attempts.
+
+    This is a module-level function taking only the url and output path
+    so that submitting it to a worker process does not pickle the whole
+    PubmedManager with its url listings.
+    """
+    for attempt in range(retries + 1):
+        try:
+            convert_pubmed_file(url, json_file)
+            return
+        except Exception:
+            if attempt == retries:
+                raise
+            logger.warning(f"Failed to process {url}, retrying", exc_info=True)
 
 
 @task(retries=1)
@@ -109,25 +148,32 @@ def task_pubmed_manager_needed_urls(
     return pubmed_manager.needed_urls(replace=replace)
 
 
-@task(retries=1)
-def task_pubmed_urls_to_json_file(pubmed_manager: PubmedManager, url: UPath):
-    pubmed_manager.pubmed_url_to_json_file(url)
-
-
 @task
 def load_pubmed_to_bigquery():
     load_to_bigquery()
 
 
 @flow
-def etl_pubmeds(replace: bool = False):
+def etl_pubmeds(replace: bool = False, max_workers: int = MAX_WORKERS):
+    """Convert all needed pubmed files to json and load them to BigQuery.
+
+    Each pubmed file is independent and parsing is CPU-bound, so the
+    files are processed in a process pool.
+    """
     pubmed_manager = PubmedManager(PUBMED_BASE, OUTPUT_UPATH)
     needed_urls = task_pubmed_manager_needed_urls(pubmed_manager, replace=replace)
     logger.info(f"Processing {len(needed_urls)} urls")
-    for index, url in enumerate(needed_urls):
-        logger.info("Processing url: " + str(url))
-        logger.info(f"Processing {index + 1} of {len(needed_urls)}")
-        task_pubmed_urls_to_json_file(pubmed_manager, url)  # type: ignore
+    with process_pool(max_workers) as executor:
+        futures = {
+            executor.submit(
+                pubmed_url_to_json_file, url, pubmed_manager.json_file_for_url(url)
+            ): url
+            for url in needed_urls
+        }
+        for index, future in enumerate(as_completed(futures)):
+            future.result()
+            logger.info(f"Processed url: {futures[future]}")
+            logger.info(f"Processed {index + 1} of {len(needed_urls)}")
     load_pubmed_to_bigquery()
 
 
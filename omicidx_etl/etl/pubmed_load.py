@@ -12,11 +12,15 @@ SETTINGS
 AS
 SELECT 
   * EXCEPT pmid,
-  pmid::UInt32 AS pmid
+  pmid::UInt32 AS pmid,
+  _path AS _json_path
 FROM 
-s3('https://storage.googleapis.com/omicidx-json/pubmed/*jsonl.gz', JSONEachRow)
+s3('https://storage.googleapis.com/omicidx-json/pubmed/pubmed*.jsonl.gz', JSONEachRow)
 SETTINGS 
-max_table_size_to_drop='100G';
+max_table_size_to_drop='100G',
+max_insert_threads=16,
+input_format_parallel_parsing=1,
+max_download_threads=8;
 """
 
 
@@ -87,7 +91,7 @@ def get_bigquery_schema():
 
 
 def load_to_bigquery():
-    client = bigquery.Client()
+    client = db.get_bigquery_client()
     schema = get_bigquery_schema()
     load_job_config = bigquery.LoadJobConfig(
         source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
@@ -1,47 +1,64 @@
+import io
+import httpx
+import orjson
 import pandas
 from prefect import flow, get_run_logger
 from google.cloud import bigquery
+from . import db
 import re
-from pathlib import Path
 
 PROJECT_ID = "omicidx-338300"
 DATASET_ID = "biodatalake"
 TABLE_ID = "src_scimago__journal_impact_factors"
+SCIMAGO_URL = "https://www.scimagojr.com/journalrank.php?out=xls"
+_CLEAN_RE = re.compile(r"[^\w\d_]+")
 
 
 @flow
 def ingest_scimago_flow() -> None:
     get_run_logger().info("Ingesting Scimago Journal Impact Factors")
+    response = httpx.get(SCIMAGO_URL, timeout=60, follow_redirects=True)
+    response.raise_for_status()
     scimago = pandas.read_csv(
-        "https://www.scimagojr.com/journalrank.php?out=xls", delimiter=";"
+        io.BytesIO(response.content),
+        delimiter=";",
+        engine="c",
     )
 
     scimago.rename(
-        lambda x: re.sub(r"[^\w\d_]+", "_", x.lower()).strip("_"),
+        lambda x: _CLEAN_RE.sub("_", x.lower()).strip("_"),
         axis="columns",
         inplace=True,
     )
 
     get_run_logger().info("Ingested Scimago Journal Impact Factors")
-    scimago.to_json("scimago.ndjson.gz", orient="records", lines=True)
-    get_run_logger().info("Saved Scimago Journal Impact Factors to ndjson.gz")
+    # the table is small, so serialize it in memory
+    buf = io.BytesIO()
+    for record in scimago.to_dict(orient="records"):
+        buf.write(
+            orjson.dumps(
+                record,
+                option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY,
+            )
+        )
+    buf.seek(0)
+    get_run_logger().info("Serialized Scimago Journal Impact Factors to ndjson")
     job_config = bigquery.LoadJobConfig(
         write_disposition="WRITE_TRUNCATE",
         autodetect=True,
-        source_format="NEWLINE_DELIMITED_JSON",
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
     )
-    client = bigquery.Client()
+    client = db.get_bigquery_client()
     table_ref = bigquery.TableReference.from_string(
         f"{PROJECT_ID}.{DATASET_ID}.{TABLE_ID}"
     )
     res = client.load_table_from_file(
-        open("scimago.ndjson.gz", "rb"),
+        buf,
         destination=table_ref,
         job_config=job_config,
     )
     get_run_logger().info(f"Loaded Scimago to BigQuery table {table_ref}")
     get_run_logger().info(res.result())
-    Path("scimago.ndjson.gz").unlink()
 
 
 if __name__ == "__main__":
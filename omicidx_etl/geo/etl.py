@@ -1,12 +1,13 @@
 import anyio
 import logging
-import re
 import faulthandler
 from upath import UPath
 from datetime import timedelta, datetime, date
 from dateutil.relativedelta import relativedelta
 from prefect import task, flow
 from ..config import settings
+from ..compression import open_gzip
+from ..logging import get_logger
 
 import httpx
 import orjson
@@ -22,47 +23,92 @@ logging.basicConfig(level=logging.INFO)
 
 OUTPUT_PATH = UPath(settings.PUBLISH_DIRECTORY) / "geo"
 OUTPUT_DIR = str(OUTPUT_PATH)
+ORJSON_OPTIONS = orjson.OPT_APPEND_NEWLINE
+ENTREZ_TO_GEO_PREFIX = {"1": "GPL", "2": "GSE", "3": "GSM"}
+ESEARCH_URL = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi"
 
 
 def get_run_logger():
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-    )
-    stream_handler = logging.StreamHandler()
-    stream_handler.setFormatter(formatter)
-    logger = logging.getLogger("geo")
-    logger.setLevel(logging.INFO)
     logging.getLogger("httpx").setLevel(logging.WARNING)
-    logger.addHandler(stream_handler)
-    return logger
+    return get_logger("geo")
 
 
 faulthandler.enable()
 
 
-@retry(wait=tenacity.wait_fixed(2), stop=tenacity.stop_after_attempt(5))
-async def get_geo_soft(accession, client) -> str:
-    """Fetches the GEO SOFT file for the given accession."""
+def is_retryable(exc: BaseException) -> bool:
+    """True for rate limiting, server errors, and transport failures."""
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(exc, httpx.TransportError)
+
+
+# back off exponentially so that a burst of 429s from raising the number
+# of fetch workers slows the workers down instead of failing the run
+retry_ncbi = retry(
+    retry=tenacity.retry_if_exception(is_retryable),
+    wait=tenacity.wait_exponential(multiplier=1, max=30),
+    stop=tenacity.stop_after_attempt(5),
+    reraise=True,
+)
+
+
+@retry_ncbi
+async def get_geo_soft(accession, client) -> bytes:
+    """Fetches the GEO SOFT file for the given accession.
+
+    The raw body is returned; it is decoded only once, by the writer,
+    right before parsing.
+    """
     url = f"https://www.ncbi.nlm.nih.gov/geo/query/acc.cgi?targ=self&acc={accession}&form=text&view=brief"
     response = await client.get(url)
     response.raise_for_status()
-    return response.text
+    return response.content
+
+
+@retry_ncbi
+async def esearch(
+    params: dict, client: httpx.AsyncClient, limiter: anyio.CapacityLimiter
+) -> dict:
+    """Runs one entrez esearch query and returns the decoded json.
+
+    At most `limiter.total_tokens` searches are in flight at once.
+    """
+    async with limiter:
+        response = await client.get(ESEARCH_URL, params=params)
+    response.raise_for_status()
+    return response.json()
+
+
+def make_http_client() -> httpx.AsyncClient:
+    """Creates a new HTTP/2 client to be shared by all GEO and entrez requests.
+
+    HTTP/2 multiplexes the many small requests over a few connections,
+    avoiding a TCP and TLS handshake per request. Failed requests are
+    retried with tenacity, not by the transport.
+    """
+    return httpx.AsyncClient(
+        http2=True,
+        timeout=60,
+        limits=httpx.Limits(max_connections=64, max_keepalive_connections=64),
+    )
 
 
 async def fetch_geo_soft_worker(
     accessions_to_fetch_receive: MemoryObjectReceiveStream,  # from entrez search
     entity_text_to_process_send: MemoryObjectSendStream,  # to process_entitity_worker
+    client: httpx.AsyncClient,
 ):
     """Fetches the GEO SOFT files for the accessions.
 
-    We read from receive stream and send the text to the send stream.
+    We read from receive stream and send the raw SOFT bytes to the send stream.
     The send stream is then processed by the write_geo_ids function.
     """
-    async with httpx.AsyncClient(timeout=30) as client:
-        async with accessions_to_fetch_receive, entity_text_to_process_send:
-            async for accession in accessions_to_fetch_receive:
-                geo_text = await get_geo_soft(accession, client)
-                await entity_text_to_process_send.send(geo_text)
+    async with accessions_to_fetch_receive, entity_text_to_process_send:
+        async for accession in accessions_to_fetch_receive:
+            geo_soft = await get_geo_soft(accession, client)
+            await entity_text_to_process_send.send(geo_soft)
 
 
 async def get_result_paths(start_date, end_date):
@@ -88,74 +134,91 @@ async def write_geo_entity_worker(
     end_date: date = date.today(),
 ):
     """Writes the entity to a file."""
-    gse_path, gsm_path, gpl_path = await get_result_paths(start_date, end_date)
+    result_paths = await get_result_paths(start_date, end_date)
+    paths = dict(zip(("GSE", "GSM", "GPL"), result_paths))
 
-    gse_f = None
-    gsm_f = None
-    gpl_f = None
+    # output files are opened lazily, one for each of GSE, GSM, and GPL
+    writers = {}
+    # parsing is CPU-bound, so run it in a worker thread to keep the
+    # event loop (and the fetch workers) responsive
     async with entity_text_to_process_receive:
-        async for text in entity_text_to_process_receive:
-            lines = [x.strip() for x in text.split("\n")]
-            entity = gp._parse_single_entity_soft(lines)
+        async for soft in entity_text_to_process_receive:
+            text = soft.decode("utf-8", errors="replace")
+            # the parser consumes the lines once, so stream them
+            lines = map(str.strip, text.split("\n"))
+            entity = await anyio.to_thread.run_sync(gp._parse_single_entity_soft, lines)
             if entity is None:
                 continue
-            if entity.accession.startswith("GSE"):  # type: ignore
-                if gse_f is None:
-                    gse_f = gse_path.open("wb", compression="gzip")
-                gse_f.write(orjson.dumps(entity.dict()) + b"\n")  # type: ignore
-            elif entity.accession.startswith("GSM"):  # type: ignore
-                if gsm_f is None:
-                    gsm_f = gsm_path.open("wb", compression="gzip")
-                gsm_f.write(orjson.dumps(entity.dict()) + b"\n")  # type: ignore
-            elif entity.accession.startswith("GPL"):  # type: ignore
-                if gpl_f is None:
-                    gpl_f = gpl_path.open("wb", compression="gzip")
-                gpl_f.write(orjson.dumps(entity.dict()) + b"\n")  # type: ignore
-    if gse_f is not None:
-        gse_f.close()
-    if gsm_f is not None:
-        gsm_f.close()
-    if gpl_f is not None:
-        gpl_f.close()
+            prefix = entity.accession[:3]  # type: ignore
+            writer = writers.get(prefix)
+            if writer is None:
+                if prefix not in paths:
+                    continue
+                writer = open_gzip(paths[prefix])
+                writers[prefix] = writer
+            writer.write(orjson.dumps(entity.model_dump(), option=ORJSON_OPTIONS))  # type: ignore
+    for writer in writers.values():
+        writer.close()
     print("exiting from write_geo_entity_worker")
 
 
 def entrezid_to_geo(entrezid: str):
-    if entrezid.startswith("2"):
-        return re.sub("^20*", "GSE", entrezid)
-    elif entrezid.startswith("1"):
-        return re.sub("^10*", "GPL", entrezid)
-    elif entrezid.startswith("3"):
-        return re.sub("^30*", "GSM", entrezid)
+    """Converts an entrez gds id to a GEO accession.
+
+    The first digit encodes the entity type and the rest, after any
+    zero padding, is the accession number: 200012345 -> GSE12345.
+    """
+    geo_prefix = ENTREZ_TO_GEO_PREFIX.get(entrezid[:1])
+    if geo_prefix is not None:
+        return geo_prefix + str(int(entrezid[1:]))
 
     raise ValueError("Expected entrezid to start with 1, 2, or 3")
 
 
-async def prod1(accessions_to_fetch_send: MemoryObjectSendStream, start_date, end_date):
+def get_weekly_ranges(start_date: date, end_date: date) -> list[tuple]:
+    """Split a date range into consecutive, non-overlapping weekly ranges.
+
+    Both ends of each returned range are inclusive, matching the
+    entrez date range search.
+    """
+    weekly_ranges = []
+    current_start = start_date
+    while current_start <= end_date:
+        current_end = min(current_start + timedelta(days=6), end_date)
+        weekly_ranges.append((current_start, current_end))
+        current_start = current_end + timedelta(days=1)
+    return weekly_ranges
+
+
+async def prod1(
+    accessions_to_fetch_send: MemoryObjectSendStream,
+    start_date,
+    end_date,
+    client: httpx.AsyncClient,
+    limiter: anyio.CapacityLimiter,
+):
     offset = 0
     RETMAX = 5000
     logger = get_run_logger()
     async with accessions_to_fetch_send:
         while True:
-            async with httpx.AsyncClient(timeout=60) as client:
-                logger.debug(f"Fetching {start_date} to {end_date} offset {offset}")
-                response = await client.get(
-                    "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/esearch.fcgi",
-                    params={
-                        "db": "gds",
-                        "term": f"""(GSM[etyp] OR GSE[etyp] OR GPL[etyp]) AND ("{start_date.strftime('%Y/%m/%d')}"[Update Date] : "{end_date.strftime('%Y/%m/%d')}"[Update Date])""",
-                        "retmode": "json",
-                        "retmax": RETMAX,
-                        "retstart": offset,
-                    },
-                )
-                response.raise_for_status()
-                json_results = response.json()
-                for id in json_results["esearchresult"]["idlist"]:
-                    await accessions_to_fetch_send.send(entrezid_to_geo(id))
-                if len(json_results["esearchresult"]["idlist"]) < RETMAX:
-                    break
-                offset += 5000
+            logger.debug(f"Fetching {start_date} to {end_date} offset {offset}")
+            json_results = await esearch(
+                {
+                    "db": "gds",
+                    "term": f"""(GSM[etyp] OR GSE[etyp] OR GPL[etyp]) AND ("{start_date.strftime('%Y/%m/%d')}"[Update Date] : "{end_date.strftime('%Y/%m/%d')}"[Update Date])""",
+                    "retmode": "json",
+                    "retmax": RETMAX,
+                    "retstart": offset,
+                },
+                client,
+                limiter,
+            )
+            for id in json_results["esearchresult"]["idlist"]:
+                await accessions_to_fetch_send.send(entrezid_to_geo(id))
+            if len(json_results["esearchresult"]["idlist"]) < RETMAX:
+                break
+            offset += 5000
 
 
 @task(task_run_name="metadata-by-date--{start_date}-{end_date}")
@@ -173,20 +236,21 @@ async def geo_metadata_by_date(
     (
         accessions_to_fetch_send,
         accessions_to_fetch_receive,
-    ) = create_memory_object_stream(100)
+    ) = create_memory_object_stream(settings.GEO_STREAM_BUF)
     (
         entity_text_to_process_send,
         entity_text_to_process_receive,
-    ) = create_memory_object_stream(100)
+    ) = create_memory_object_stream(settings.GEO_STREAM_BUF)
 
-    async with anyio.create_task_group() as tg:
-        # start 30 workers to fetch the GEO SOFT files
+    async with make_http_client() as client, anyio.create_task_group() as tg:
+        # start workers to fetch the GEO SOFT files
         async with accessions_to_fetch_receive, entity_text_to_process_send:
-            for i in range(30):
+            for i in range(settings.GEO_FETCHERS):
                 tg.start_soon(
                     fetch_geo_soft_worker,
                     accessions_to_fetch_receive.clone(),
                     entity_text_to_process_send.clone(),
+                    client,
                 )
         # start a worker to write the entity to a file
         # this worker will write the entity to a file
@@ -198,8 +262,20 @@ async def geo_metadata_by_date(
                 start_date,
                 end_date,
             )
+        # shard the entrez search by week so that pagination of one
+        # shard does not stall the fetch workers
+        # and share one limit on concurrent searches between the shards
+        esearch_limiter = anyio.CapacityLimiter(settings.GEO_ESEARCH_CONCURRENCY)
         async with accessions_to_fetch_send:
-            tg.start_soon(prod1, accessions_to_fetch_send.clone(), start_date, end_date)
+            for shard_start, shard_end in get_weekly_ranges(start_date, end_date):
+                tg.start_soon(
+                    prod1,
+                    accessions_to_fetch_send.clone(),
+                    shard_start,
+                    shard_end,
+                    client,
+                    esearch_limiter,
+                )
 
 
 @task
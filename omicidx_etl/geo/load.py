@@ -1,4 +1,5 @@
 from google.cloud import bigquery
+from ..etl import db
 from .schema import get_schema
 
 
@@ -10,7 +11,7 @@ def load_to_bigquery(entity: str):
         entity (str): The GEO entity to load.
 
     """
-    client = bigquery.Client()
+    client = db.get_bigquery_client()
     schema = get_schema(entity)
     load_job_config = bigquery.LoadJobConfig(
         source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
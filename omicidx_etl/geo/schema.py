@@ -1,186 +1,157 @@
-from google.cloud import bigquery
-
-schema = {}
-schema["gse"] = [
-    bigquery.SchemaField("pubmed_ids", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("status", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("update_date", "TIMESTAMP", mode="NULLABLE"),
-    bigquery.SchemaField("meta_update_date", "TIMESTAMP", mode="NULLABLE"),
-    bigquery.SchemaField("publish_date", "TIMESTAMP", mode="NULLABLE"),
-    bigquery.SchemaField("received_date", "TIMESTAMP", mode="NULLABLE"),
-    bigquery.SchemaField("visibility", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("insdc", "BOOLEAN", mode="NULLABLE"),
-    bigquery.SchemaField("accession", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("alias", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("title", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("center_name", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("broker_name", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("description", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField(
-        "attributes",
-        "RECORD",
-        mode="REPEATED",
-        fields=[
-            bigquery.SchemaField("value", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("tag", "STRING", mode="NULLABLE"),
-        ],
-    ),
-    bigquery.SchemaField(
-        "identifiers",
-        "RECORD",
-        mode="REPEATED",
-        fields=[
-            bigquery.SchemaField("id", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("namespace", "STRING", mode="NULLABLE"),
-        ],
-    ),
-    bigquery.SchemaField(
-        "xrefs",
-        "RECORD",
-        mode="REPEATED",
-        fields=[
-            bigquery.SchemaField("id", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("db", "STRING", mode="NULLABLE"),
-        ],
-    ),
-    bigquery.SchemaField("study_type", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("study_accession", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("abstract", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("BioProject", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("GEO", "STRING", mode="NULLABLE"),
-]
+"""BigQuery schemas for the GEO entities.
+
+The schemas are kept as plain `(name, field_type, mode[, fields])` tuples
+and only turned into `bigquery.SchemaField` objects on first use, so
+importing this module does not import google-cloud-bigquery.
+"""
+
+import functools
+
+from ..schemas import read_only
+
+_NAME_FIELDS = (
+    ("last", "STRING", "NULLABLE"),
+    ("middle", "STRING", "NULLABLE"),
+    ("first", "STRING", "NULLABLE"),
+)
+
+_CONTACT_FIELDS = (
+    ("phone", "STRING", "NULLABLE"),
+    ("institute", "STRING", "NULLABLE"),
+    ("web_link", "STRING", "NULLABLE"),
+    ("country", "STRING", "NULLABLE"),
+    ("department", "STRING", "NULLABLE"),
+    ("state", "STRING", "NULLABLE"),
+    ("email", "STRING", "NULLABLE"),
+    ("name", "RECORD", "NULLABLE", _NAME_FIELDS),
+    ("address", "STRING", "NULLABLE"),
+    ("zip_postal_code", "STRING", "NULLABLE"),
+    ("city", "STRING", "NULLABLE"),
+)
+
+# fields shared by every GEO entity (omicidx.geo.pydantic_models.GEOBase
+# plus the description and contact block that all three carry)
+_GEO_COMMON = (
+    ("accession", "STRING", "NULLABLE"),
+    ("title", "STRING", "NULLABLE"),
+    ("status", "STRING", "NULLABLE"),
+    ("submission_date", "DATE", "NULLABLE"),
+    ("last_update_date", "DATE", "NULLABLE"),
+    ("description", "STRING", "NULLABLE"),
+    ("contact", "RECORD", "NULLABLE", _CONTACT_FIELDS),
+)
+
+
+def _with_common(*extras: tuple) -> tuple:
+    """Return the common GEO fields followed by the entity-specific ones."""
+    return _GEO_COMMON + extras
+
+
+SCHEMA_SPECS = {}
+# fields follow omicidx.geo.pydantic_models.GEOSeries
+SCHEMA_SPECS["gse"] = _with_common(
+    ("subseries", "STRING", "REPEATED"),
+    ("bioprojects", "STRING", "REPEATED"),
+    ("sra_studies", "STRING", "REPEATED"),
+    ("type", "STRING", "REPEATED"),
+    ("summary", "STRING", "NULLABLE"),
+    ("relation", "STRING", "REPEATED"),
+    ("pubmed_id", "INTEGER", "REPEATED"),
+    ("sample_id", "STRING", "REPEATED"),
+    ("sample_taxid", "INTEGER", "REPEATED"),
+    ("sample_organism", "STRING", "REPEATED"),
+    ("platform_id", "STRING", "REPEATED"),
+    ("platform_taxid", "INTEGER", "REPEATED"),
+    ("platform_organism", "STRING", "REPEATED"),
+    ("data_processing", "STRING", "NULLABLE"),
+    ("supplemental_files", "STRING", "REPEATED"),
+    ("overall_design", "STRING", "NULLABLE"),
+    ("contributor", "RECORD", "REPEATED", _NAME_FIELDS),
+)
 
 
-schema["gsm"] = [
-    bigquery.SchemaField("submission_date", "DATE", mode="NULLABLE"),
-    bigquery.SchemaField(
+SCHEMA_SPECS["gsm"] = _with_common(
+    (
         "channels",
         "RECORD",
-        mode="REPEATED",
-        fields=[
-            bigquery.SchemaField(
+        "REPEATED",
+        (
+            (
                 "characteristics",
                 "RECORD",
-                mode="REPEATED",
-                fields=[
-                    bigquery.SchemaField("value", "STRING", mode="NULLABLE"),
-                    bigquery.SchemaField("tag", "STRING", mode="NULLABLE"),
-                ],
+                "REPEATED",
+                (
+                    ("value", "STRING", "NULLABLE"),
+                    ("tag", "STRING", "NULLABLE"),
+                ),
             ),
-            bigquery.SchemaField("treatment_protocol", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("extract_protocol", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("label_protocol", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("source_name", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("organism", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("molecule", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("taxid", "INTEGER", mode="REPEATED"),
-            bigquery.SchemaField("growth_protocol", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("label", "STRING", mode="NULLABLE"),
-        ],
+            ("treatment_protocol", "STRING", "NULLABLE"),
+            ("extract_protocol", "STRING", "NULLABLE"),
+            ("label_protocol", "STRING", "NULLABLE"),
+            ("source_name", "STRING", "NULLABLE"),
+            ("organism", "STRING", "NULLABLE"),
+            ("molecule", "STRING", "NULLABLE"),
+            ("taxid", "INTEGER", "REPEATED"),
+            ("growth_protocol", "STRING", "NULLABLE"),
+            ("label", "STRING", "NULLABLE"),
+        ),
     ),
-    bigquery.SchemaField("status", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("overall_design", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("library_source", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("data_row_count", "INTEGER", mode="NULLABLE"),
-    bigquery.SchemaField("title", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("data_processing", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("channel_count", "INTEGER", mode="NULLABLE"),
-    bigquery.SchemaField("platform_id", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("tag_length", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("anchor", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("contributor", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("biosample", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("sra_experiment", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("description", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField(
-        "contact",
-        "RECORD",
-        mode="NULLABLE",
-        fields=[
-            bigquery.SchemaField("phone", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("institute", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("web_link", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("country", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("department", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("state", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("email", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField(
-                "name",
-                "RECORD",
-                mode="NULLABLE",
-                fields=[
-                    bigquery.SchemaField("last", "STRING", mode="NULLABLE"),
-                    bigquery.SchemaField("middle", "STRING", mode="NULLABLE"),
-                    bigquery.SchemaField("first", "STRING", mode="NULLABLE"),
-                ],
-            ),
-            bigquery.SchemaField("address", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("zip_postal_code", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("city", "STRING", mode="NULLABLE"),
-        ],
-    ),
-    bigquery.SchemaField("supplemental_files", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("scan_protocol", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("tag_count", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("type", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("hyb_protocol", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("accession", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("last_update_date", "DATE", mode="NULLABLE"),
-]
-
-
-schema["gpl"] = [
-    bigquery.SchemaField("manufacture_protocol", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("relation", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("data_row_count", "INTEGER", mode="NULLABLE"),
-    bigquery.SchemaField("manufacturer", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("distribution", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("description", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("series_id", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("title", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("status", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("sample_id", "STRING", mode="REPEATED"),
-    bigquery.SchemaField("summary", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField(
-        "contact",
-        "RECORD",
-        mode="NULLABLE",
-        fields=[
-            bigquery.SchemaField("phone", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("institute", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("web_link", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("country", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("department", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("state", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("email", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField(
-                "name",
-                "RECORD",
-                mode="NULLABLE",
-                fields=[
-                    bigquery.SchemaField("last", "STRING", mode="NULLABLE"),
-                    bigquery.SchemaField("middle", "STRING", mode="NULLABLE"),
-                    bigquery.SchemaField("first", "STRING", mode="NULLABLE"),
-                ],
-            ),
-            bigquery.SchemaField("address", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("zip_postal_code", "STRING", mode="NULLABLE"),
-            bigquery.SchemaField("city", "STRING", mode="NULLABLE"),
-        ],
-    ),
-    bigquery.SchemaField("technology", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("accession", "STRING", mode="NULLABLE"),
-    bigquery.SchemaField("contributor", "JSON", mode="NULLABLE"),
-    bigquery.SchemaField("last_update_date", "DATE", mode="NULLABLE"),
-    bigquery.SchemaField("submission_date", "DATE", mode="NULLABLE"),
-    bigquery.SchemaField("organism", "STRING", mode="NULLABLE"),
-]
+    ("overall_design", "STRING", "NULLABLE"),
+    ("library_source", "STRING", "NULLABLE"),
+    ("data_row_count", "INTEGER", "NULLABLE"),
+    ("data_processing", "STRING", "NULLABLE"),
+    ("channel_count", "INTEGER", "NULLABLE"),
+    ("platform_id", "STRING", "NULLABLE"),
+    ("tag_length", "STRING", "NULLABLE"),
+    ("anchor", "STRING", "NULLABLE"),
+    ("contributor", "STRING", "REPEATED"),
+    ("biosample", "STRING", "NULLABLE"),
+    ("sra_experiment", "STRING", "NULLABLE"),
+    ("supplemental_files", "STRING", "REPEATED"),
+    ("scan_protocol", "STRING", "NULLABLE"),
+    ("tag_count", "STRING", "NULLABLE"),
+    ("type", "STRING", "NULLABLE"),
+    ("hyb_protocol", "STRING", "NULLABLE"),
+)
 
 
+SCHEMA_SPECS["gpl"] = _with_common(
+    ("manufacture_protocol", "STRING", "NULLABLE"),
+    ("relation", "STRING", "REPEATED"),
+    ("data_row_count", "INTEGER", "NULLABLE"),
+    ("manufacturer", "STRING", "REPEATED"),
+    ("distribution", "STRING", "NULLABLE"),
+    ("series_id", "STRING", "REPEATED"),
+    ("sample_id", "STRING", "REPEATED"),
+    ("summary", "STRING", "NULLABLE"),
+    ("technology", "STRING", "NULLABLE"),
+    ("contributor", "JSON", "NULLABLE"),
+    ("organism", "STRING", "NULLABLE"),
+)
+
+
+SCHEMA_SPECS = read_only(SCHEMA_SPECS)
+
+
+@functools.lru_cache(maxsize=None)
+def _to_field(spec: tuple):
+    # specs are hashable tuples, so identical definitions (e.g. the shared
+    # contact and name records) are built once and share one SchemaField
+    from google.cloud import bigquery
+
+    name, field_type, mode, *fields = spec
+    subfields = [_to_field(subspec) for subspec in fields[0]] if fields else ()
+    return bigquery.SchemaField(name, field_type, mode=mode, fields=subfields)
+
+
+@functools.lru_cache(maxsize=None)
 def get_schema(entity: str):
     """Get the schema for the given entity.
 
+    The schema is built on first request and cached, so it is returned
+    as a tuple that callers cannot modify.
+
     Args:
         entity (str): The entity to get the schema for. One of 'gse', 'gsm', 'gpl'.
     """
-    return schema[entity]
+    return tuple(_to_field(spec) for spec in SCHEMA_SPECS[entity])
@@ -11,6 +11,10 @@ stream_handler.setFormatter(formatter)
 
 def get_logger(name: str = "main", level: int = logging.INFO):
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
-    logger.addHandler(stream_handler)
+    logger.setLevel(level)
+    # get_logger is called repeatedly for the same name; only attach the
+    # handler once, and do not also emit every record via the root logger
+    if stream_handler not in logger.handlers:
+        logger.addHandler(stream_handler)
+    logger.propagate = False
     return logger
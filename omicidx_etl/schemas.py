@@ -0,0 +1,14 @@
+"""helpers for the module-level BigQuery schema definitions"""
+
+import types
+
+
+def read_only(schemas: dict) -> types.MappingProxyType:
+    """Return a read-only view of `schemas` with each entity's fields as a tuple.
+
+    The schema definitions are shared by every load in the process, so
+    the view keeps callers from modifying them.
+    """
+    return types.MappingProxyType(
+        {entity: tuple(fields) for entity, fields in schemas.items()}
+    )
@@ -1,23 +1,86 @@
-from omicidx.sra.parser import sra_object_generator
+import io
+import threading
+import time
+from contextlib import closing
+from pathlib import Path
+from queue import Full, Queue
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from omicidx.sra.parser import (
+    SRAExperimentRecord,
+    SRARunRecord,
+    SRASampleRecord,
+    SRAStudyRecord,
+)
 from upath import UPath
 from prefect import task, flow
-from .utils import bigquery_load
+from .utils import ENTITIES, bigquery_load
 from ..config import settings
+from ..compression import gzip, open_gzip
+from ..downloads import MAX_WORKERS, get_http_client, process_pool
 
 
 import orjson
-import gzip
-import tempfile
-import shutil
 
-import re
+from itertools import islice
 
 from ..logging import get_logger
 
+try:
+    # lxml can filter by tag inside libxml2, so the python loop only
+    # sees the record elements rather than every element in the file
+    from lxml import etree
+
+    HAS_LXML = True
+except ImportError:
+    from xml.etree import ElementTree as etree
+
+    HAS_LXML = False
+
 logger = get_logger(__name__)
 
 OUTPUT_PATH = UPath(settings.PUBLISH_DIRECTORY) / "sra"
 OUTPUT_DIR = str(OUTPUT_PATH)
+# number of records serialized per write to the output file
+WRITE_BATCH_SIZE = 10_000
+# read size for the compressed http stream
+DOWNLOAD_BUFFER_SIZE = 1 << 20
+# number of downloaded chunks the reader thread may get ahead of the parser
+PREFETCH_CHUNKS = 16
+# read size on the decompressed side; the stdlib default is only 8 KiB
+DECOMPRESS_BUFFER_SIZE = 128 * 1024
+# listing the mirror directories is network bound, so overlap the requests
+LISTING_WORKERS = 16
+
+MIRROR_URL = "https://ftp.ncbi.nlm.nih.gov/sra/reports/Mirroring"
+# the recursive listing of the mirror is slow, so keep a copy on disk
+DIRLIST_CACHE = Path.home() / ".cache" / "omicidx" / "mirror_dirs.json"
+DIRLIST_CACHE_TTL = 3600
+
+SRA_RECORD_CLASSES = {
+    "STUDY": SRAStudyRecord,
+    "SAMPLE": SRASampleRecord,
+    "EXPERIMENT": SRAExperimentRecord,
+    "RUN": SRARunRecord,
+}
+
+
+def mirror_dirlist() -> list[str]:
+    """return the dated directories at the top level of the NCBI SRA mirror
+
+    The listing is cached in `DIRLIST_CACHE` and only fetched again
+    once the cached copy is older than `DIRLIST_CACHE_TTL` seconds.
+    """
+    try:
+        if time.time() - DIRLIST_CACHE.stat().st_mtime < DIRLIST_CACHE_TTL:
+            return orjson.loads(DIRLIST_CACHE.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        pass
+    # only the top level is needed; a recursive glob would crawl every
+    # directory of every mirror snapshot just to list the dates
+    dirlist = [str(path).rstrip("/") for path in UPath(MIRROR_URL).glob("*/")]
+    DIRLIST_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    DIRLIST_CACHE.write_bytes(orjson.dumps(dirlist))
+    return dirlist
 
 
 def mirror_dirlist_for_current_month(current_month_only: bool = True) -> list[UPath]:
@@ -32,83 +95,263 @@ def mirror_dirlist_for_current_month(current_month_only: bool = True) -> list[UP
 
     >>> mirror_dirlist_for_current_month()
     """
-    u = UPath("https://ftp.ncbi.nlm.nih.gov/sra/reports/Mirroring")
-    pathlist = sorted(list(u.glob("**/")), reverse=True)
-    index = 0
-    for path in pathlist:
-        index += 1
-        match = re.search(r"_Full$", str(path.parent))
-        if match is not None and current_month_only:
-            return pathlist[:index]
-    return pathlist
-
-
-@task
-def sra_parse(url: str, outfile_name: str):
+    # the directory names end in the date, so the newest sort first
+    dirlist = sorted((path.rstrip("/") for path in mirror_dirlist()), reverse=True)
+    if current_month_only:
+        for index, path in enumerate(dirlist):
+            if path.endswith("_Full"):
+                dirlist = dirlist[: index + 1]
+                break
+    return [UPath(path) for path in dirlist]
+
+
+def prefetch(chunks, maxsize: int = PREFETCH_CHUNKS):
+    """Iterate over `chunks` while a background thread reads ahead.
+
+    Network reads release the GIL, so the download keeps going while the
+    caller decompresses and parses the chunks already received. Close the
+    returned generator to stop the reader thread early.
+    """
+    queue = Queue(maxsize=maxsize)
+    stop = threading.Event()
+    done = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def read_ahead():
+        try:
+            for chunk in chunks:
+                if not put(chunk):
+                    return
+            put(done)
+        except BaseException as exc:
+            put(exc)
+
+    thread = threading.Thread(target=read_ahead, daemon=True)
+    thread.start()
+    try:
+        while (item := queue.get()) is not done:
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+class ResponseStream(io.RawIOBase):
+    """Read-only file object over the byte chunks of a streamed response.
+
+    Args:
+        chunks (Iterator[bytes]): e.g. `httpx.Response.iter_raw()`
+    """
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._pending = memoryview(b"")
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._pending:
+            try:
+                self._pending = memoryview(next(self._chunks))
+            except StopIteration:
+                return 0
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+
+def sra_record_dicts(fh):
+    """Iterate over the records in an SRA meta_XXX_set xml file.
+
+    Like `omicidx.sra.parser.sra_object_generator`, but yields each
+    record's data dict directly, uses lxml when it is installed and drops
+    each record from the tree once it has been parsed, so memory stays
+    flat for multi-GB files.
+
+    Args:
+        fh: an open binary file handle
+
+    Returns:
+        An iterator over the records' data as plain dicts; the record
+        objects themselves are not kept.
+    """
+    if HAS_LXML:
+        # the record classes treat every child node as an element, so leave
+        # comments and processing instructions out of the tree, as the
+        # stdlib parser does
+        events = etree.iterparse(
+            fh,
+            events=("end",),
+            tag=tuple(SRA_RECORD_CLASSES),
+            remove_comments=True,
+            remove_pis=True,
+            huge_tree=True,
+        )
+    else:
+        events = etree.iterparse(fh, events=("end",))
+    for _, element in events:
+        record_class = SRA_RECORD_CLASSES.get(element.tag)
+        if record_class is None:
+            continue
+        yield record_class(element).data
+        element.clear()
+        if HAS_LXML:
+            # remove the already parsed records that precede this one
+            parent = element.getparent()
+            if parent is not None and parent.getparent() is None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+
+def sra_parse(url: str, outfile_name: str, skip_existing: bool = True) -> int:
+    """Convert one SRA mirror xml.gz file to gzipped ndjson.
+
+    This is a plain function rather than a task so that it can run in
+    a worker process.
+
+    Args:
+        url (str): the xml.gz url to convert
+        outfile_name (str): where to write the gzipped ndjson
+        skip_existing (bool): return early if `outfile_name` already exists;
+            callers that have already listed the outputs can pass False to
+            skip the extra stat
+
+    Returns:
+        int: the number of records written, 0 if the output already existed
+    """
     logger.info(f"Processing {url} to {outfile_name}")
-    if UPath(outfile_name).exists():
+    if skip_existing and UPath(outfile_name).exists():
         logger.info(f"{outfile_name} already exists. Skipping")
-        return
-
-    # while it is technically possible to stream from the URL
-    # the safer way is to download the file first
-    # I use the './' directory for github actions where the
-    # tempfile system is small compared to the working directory
-    # Avoids the "OSError: No space left on device"
-    with tempfile.NamedTemporaryFile(dir="./") as tmpfile:
-        # download the file to a temporary file
-        shutil.copyfileobj(UPath(url).open("rb"), tmpfile)
-        # read the file and write to the output file
-        tmpfile.seek(0)
-        with gzip.open(tmpfile, "rb") as fh:
-            with UPath(outfile_name).open("wb", compression="gzip") as outfile:
-                # iterate over the objects and write them to the output file
-                for obj in sra_object_generator(fh):
-                    outfile.write(orjson.dumps(obj.data) + b"\n")
+        return 0
+
+    # stream the response straight into the decompressor so that the
+    # download overlaps with parsing and nothing is staged on local disk.
+    # Write to a ".part" sibling first so that an interrupted run does not
+    # leave a truncated file that the exists() check above would skip.
+    part_path = UPath(f"{outfile_name}.part")
+    try:
+        with get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            # the files are already gzipped, so skip httpx's decoding; a
+            # background thread keeps downloading while this one parses
+            chunks = prefetch(response.iter_raw(chunk_size=DOWNLOAD_BUFFER_SIZE))
+            with closing(chunks):
+                source = io.BufferedReader(
+                    ResponseStream(chunks), buffer_size=DOWNLOAD_BUFFER_SIZE
+                )
+                # hand the xml parser large decompressed chunks as well
+                with io.BufferedReader(
+                    gzip.open(source, "rb"), buffer_size=DECOMPRESS_BUFFER_SIZE
+                ) as fh:
+                    with open_gzip(part_path) as outfile:
+                        record_count = write_ndjson(sra_record_dicts(fh), outfile)
+        part_path.rename(UPath(outfile_name))
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+    return record_count
+
+
+def write_ndjson(records, outfile) -> int:
+    """Write each record dict to `outfile` as ndjson.
+
+    The records are serialized in batches; writelines hands each batch
+    to the buffered writer without joining it first.
+
+    Returns:
+        int: the number of records written
+    """
+    record_count = 0
+    while batch := list(islice(records, WRITE_BATCH_SIZE)):
+        record_count += len(batch)
+        outfile.writelines(
+            orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE) for record in batch
+        )
+    return record_count
 
 
 def get_pathlist():
     return mirror_dirlist_for_current_month()
 
 
+def list_xml_urls(path: UPath) -> list[UPath]:
+    """return the xml.gz files in the mirror directory `path`"""
+    return list(path.glob("**/*xml.gz"))
+
+
+def json_outfile_name_from_url(url: str) -> str:
+    """return the ndjson file name for an SRA mirror xml.gz url
+
+    The name is prefixed with the mirror directory name so that files
+    from different mirror snapshots do not collide.
+    """
+    dirname, xml_name = url.rsplit("/", 2)[-2:]
+    return f"{dirname}_{xml_name.replace('.xml.gz', '.ndjson.gz')}"
+
+
 @task(task_run_name="load-{entity}-to-bigquery")
 def task_load_entities_to_bigquery(entity: str, plural_entity: str):
     bigquery_load(entity, plural_entity)
 
 
 @flow
-def sra_get_urls():
+def sra_get_urls(max_workers: int = MAX_WORKERS):
     pathlist = get_pathlist()
-    current_gcs_objects = []
+    # list the existing outputs once rather than checking each url's
+    # output on its own; the same listing drives the cleanup below
+    existing_objects = list(UPath(OUTPUT_DIR).glob("*set.ndjson.gz"))
+    existing_names = {obj.name for obj in existing_objects}
+    # names of the output files that belong to the current mirror
+    current_names: set[str] = set()
+    jobs = {}
 
-    for parent in pathlist:
-        p = parent.parent
-        urls = list(p.glob("**/*xml.gz"))
+    with ThreadPoolExecutor(max_workers=LISTING_WORKERS) as executor:
+        url_lists = list(executor.map(list_xml_urls, pathlist))
+
+    for urls in url_lists:
         logger.info(f"Processing {urls}")
-        for url in urls:
-            if url.name == "meta_analysis_set.xml.gz":
+        # plain string operations; no need to parse each url into a UPath
+        for url in map(str, urls):
+            if url.endswith("/meta_analysis_set.xml.gz"):
+                continue
+            json_name = json_outfile_name_from_url(url)
+            current_names.add(json_name)
+            if json_name in existing_names:
+                logger.info(f"{json_name} already exists. Skipping")
                 continue
-            path_part = url.parts[-2]
-            xml_name = url.parts[-1]
-            json_name = xml_name.replace(".xml.gz", ".ndjson.gz")
-            outfile_name = f"{path_part}_{json_name}"
-            sra_parse(
-                url=str(url),
-                outfile_name=f"{OUTPUT_DIR}/{outfile_name}",
+            jobs[url] = f"{OUTPUT_DIR}/{json_name}"
+
+    # each file is independent, so parse them in separate processes
+    with process_pool(max_workers) as executor:
+        futures = {
+            executor.submit(sra_parse, url, outfile_name, skip_existing=False): url
+            for url, outfile_name in jobs.items()
+        }
+        for index, future in enumerate(as_completed(futures)):
+            record_count = future.result()
+            logger.info(
+                f"Processed {index + 1} of {len(jobs)}: {futures[future]}"
+                f" ({record_count} records)"
             )
-            current_gcs_objects.append(UPath(f"{OUTPUT_DIR}/{outfile_name}"))
-    all_objects = UPath(OUTPUT_DIR).glob("*set.ndjson.gz")
-    for obj in all_objects:
-        if obj not in current_gcs_objects:
+    stale_objects = [obj for obj in existing_objects if obj.name not in current_names]
+    if stale_objects:
+        for obj in stale_objects:
             logger.info(f"Deleting old {obj}")
-            obj.unlink()
-    entities = {
-        "study": "studies",
-        "sample": "samples",
-        "experiment": "experiments",
-        "run": "runs",
-    }
-    for entity, plural_entity in entities.items():
+        # one bulk call lets the filesystem batch the deletes
+        OUTPUT_PATH.fs.rm([obj.path for obj in stale_objects])
+    for entity, plural_entity in ENTITIES.items():
         task_load_entities_to_bigquery(entity, plural_entity)
 
 
@@ -1,4 +1,5 @@
 from google.cloud import bigquery
+from ..schemas import read_only
 
 schema = {}
 
@@ -191,7 +192,10 @@ schema["sample"] = [
 ]
 
 
-def get_schema(entity: str) -> list[bigquery.SchemaField]:
+schema = read_only(schema)
+
+
+def get_schema(entity: str) -> tuple[bigquery.SchemaField, ...]:
     """Get the schema for a given entity.
 
     Args:
@@ -1,3 +1,6 @@
+from collections.abc import Mapping
+from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
 from ..etl import db
 from .. import logging
 from prefect import task
@@ -6,9 +9,16 @@ from .schema import get_schema
 
 logger = logging.get_logger("loader")
 
+ENTITIES = {
+    "study": "studies",
+    "sample": "samples",
+    "experiment": "experiments",
+    "run": "runs",
+}
+
 
 def bigquery_load(entity: str, plural_entity: str):
-    client = bigquery.Client()
+    client = db.get_bigquery_client()
 
     schema = get_schema(entity)
 
@@ -43,28 +53,47 @@ SELECT
     _file,
     _path
 FROM
-s3('https://storage.googleapis.com/omicidx-json/sra/*{entity}_set.ndjson.gz', JSONEachRow);
+s3('https://storage.googleapis.com/omicidx-json/sra/*{entity}_set.ndjson.gz', JSONEachRow)
+SETTINGS
+    input_format_parallel_parsing = 1,
+    max_download_threads = 16,
+    max_insert_threads = 16,
+    min_insert_block_size_rows = 1048576;
 """
     return sql
 
 
-@task(task_run_name="load-{entity}-to-clickhouse")
-def load_entities_to_clickhouse(entity: str, plural_entity: str):
+def clickhouse_load(entity: str, plural_entity: str) -> dict:
     sql = get_sql(entity, plural_entity)
+    # clickhouse clients are not safe to share across threads
     client = db.get_client()
     res = client.command(sql)
     summary_info = res.summary  # type: ignore
     summary_info[entity] = plural_entity
     logger.info(f"Created table {entity}")
     logger.info(summary_info)
+    return summary_info
+
+
+@task
+def load_all_entities_to_clickhouse(
+    entities: Optional[Mapping[str, str]] = None,
+) -> list:
+    """Load all SRA entities to ClickHouse concurrently.
+
+    Each entity is an independent scan of GCS, so running them in
+    parallel bounds the wall-clock time by the slowest entity.
+    Defaults to all of ENTITIES.
+    """
+    if entities is None:
+        entities = ENTITIES
+    with ThreadPoolExecutor(max_workers=len(entities)) as executor:
+        futures = [
+            executor.submit(clickhouse_load, entity, plural_entity)
+            for entity, plural_entity in entities.items()
+        ]
+        return [future.result() for future in futures]
 
 
 if __name__ == "__main__":
-    entities = {
-        "study": "studies",
-        "sample": "samples",
-        "experiment": "experiments",
-        "run": "runs",
-    }
-    for entity, plural_entity in entities.items():
-        load_entities_to_clickhouse(entity, plural_entity)
+    load_all_entities_to_clickhouse()
@@ -0,0 +1,42 @@
+import io
+
+from omicidx.sra.parser import sra_object_generator
+
+from omicidx_etl.sra.etl import sra_record_dicts
+
+# one study and one sample, with a comment and a processing instruction
+# inside the records to check that neither turns up in the parsed data
+SRA_XML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<STUDY_SET>
+  <STUDY accession="SRP000001" alias="study-alias" center_name="GEO">
+    <IDENTIFIERS>
+      <PRIMARY_ID>SRP000001</PRIMARY_ID>
+      <!-- c -->
+      <EXTERNAL_ID namespace="BioProject">PRJNA1</EXTERNAL_ID>
+    </IDENTIFIERS>
+    <DESCRIPTOR>
+      <STUDY_TITLE>A study</STUDY_TITLE>
+      <?pi ignored?>
+      <STUDY_TYPE existing_study_type="Other"/>
+      <STUDY_ABSTRACT>An abstract</STUDY_ABSTRACT>
+    </DESCRIPTOR>
+    <STUDY_ATTRIBUTES>
+      <STUDY_ATTRIBUTE><TAG>key</TAG><VALUE>value</VALUE></STUDY_ATTRIBUTE>
+    </STUDY_ATTRIBUTES>
+  </STUDY>
+  <SAMPLE accession="SRS000001" alias="sample-alias">
+    <IDENTIFIERS>
+      <PRIMARY_ID>SRS000001</PRIMARY_ID>
+      <!-- c -->
+    </IDENTIFIERS>
+    <TITLE>A sample</TITLE>
+    <SAMPLE_NAME><TAXON_ID>9606</TAXON_ID></SAMPLE_NAME>
+  </SAMPLE>
+</STUDY_SET>
+"""
+
+
+def test_sra_record_dicts_matches_sra_object_generator():
+    expected = [obj.data for obj in sra_object_generator(io.BytesIO(SRA_XML))]
+    assert len(expected) == 2
+    assert list(sra_record_dicts(io.BytesIO(SRA_XML))) == expected